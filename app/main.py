@@ -3,28 +3,38 @@ import pandas as pd
 import numpy as np
 import io
 import zipfile
-import tempfile
 import os
 from datetime import datetime
-from pdf_generator.generator import generate_pdf, SUBJECT_IMAGES
+from pdf_generator.generator import PdfRenderer, SUBJECT_IMAGES, generate_pdfs_parallel
 from utils.file_processor import detect_encoding, validate_dataframe
 import subprocess
 
-# Playwrightのブラウザインストール
-if not os.path.exists("/home/appuser/.cache/ms-playwright"):
+
+@st.cache_resource(show_spinner="ブラウザを準備中...")
+def install_playwright_browser():
+    """
+    Playwrightのブラウザをインストール
+
+    ビルド時（setup.sh）にインストール済みであれば何もしない。
+    成功した結果だけをキャッシュし、失敗した場合は次の再実行で再試行する。
+    """
+    if os.path.exists("/home/appuser/.cache/ms-playwright"):
+        return
     try:
         subprocess.run(["playwright", "install", "chromium"], check=True)
         os.makedirs("/home/appuser/.cache", exist_ok=True)
         os.chmod("/home/appuser/.cache", 0o777)
     except Exception as e:
         print(f"Failed to install Playwright browser: {e}")
+        # 例外はキャッシュされないため、失敗は記録されずに次回再試行される
+        raise
+
 
-# ページ設定
-st.set_page_config(page_title="成績表PDF生成アプリ", page_icon="📊", layout="wide")
+@st.cache_resource(show_spinner=False)
+def get_renderer():
+    """PDFレンダラーを取得（ブラウザは再実行やセッションをまたいで使い回す）"""
+    return PdfRenderer()
 
-# セッション状態の初期化
-if "generated_pdfs" not in st.session_state:
-    st.session_state.generated_pdfs = []
 
 # 定数定義
 REQUIRED_COLUMNS = [
@@ -37,6 +47,8 @@ REQUIRED_COLUMNS = [
 ]
 SUBJECTS = list(SUBJECT_IMAGES.keys())
 GRADE = ["小1", "小2", "小3", "小4", "小5", "小6", "中1", "中2", "中3"]
+# この件数以上のときだけ複数のプロセスでPDFを生成する
+PARALLEL_MIN_ROWS = 50
 
 
 def validate_input(values):
@@ -96,7 +108,7 @@ def create_single_pdf():
         else:
             try:
                 with st.spinner("PDFを生成中..."):
-                    pdf_data = generate_pdf(input_values)
+                    pdf_data = get_renderer().render(input_values)
 
                     # PDFのダウンロードボタンを表示
                     st.success("PDF生成が完了しました")
@@ -113,6 +125,61 @@ def create_single_pdf():
                 st.error(f"PDF生成中にエラーが発生しました: {str(e)}")
 
 
+@st.cache_data(show_spinner=False, max_entries=16, ttl=3600)
+def load_uploaded_file(file_id, _uploaded_file):
+    """
+    アップロードされたファイルを読み込んで検証する
+
+    同じファイルでの再実行時は、読み込み結果をキャッシュから返す。
+    キャッシュはサーバー全体で共有されるため、件数と保持時間を制限する。
+
+    Args:
+        file_id: アップロードファイルのID（キャッシュのキー）
+        _uploaded_file: Streamlitのアップロードファイルオブジェクト
+
+    Returns:
+        tuple: (データフレーム, エラーメッセージまたはNone, プレビュー用の先頭5行)
+    """
+    # ファイルの読み込みとエンコーディング検出
+    if _uploaded_file.type == "text/csv":
+        encoding = detect_encoding(_uploaded_file)
+        df = pd.read_csv(
+            _uploaded_file,
+            encoding=encoding,
+            dtype = {
+                'subject': str,
+                'test_name': str,
+                'score': int,
+                'sc_year': str,
+                'last_name': str,
+                'first_name': str
+            }
+        )
+    else:  # Excel
+        # 必要な列だけを読み込む（数値と文字列が混在しても読めるよう文字列型にする）
+        excel_options = {
+            "usecols": lambda col: col in REQUIRED_COLUMNS,
+            "dtype": {"subject": "string", "sc_year": "string"},
+        }
+        try:
+            # Rust実装のcalamineで読み込む
+            df = pd.read_excel(_uploaded_file, engine="calamine", **excel_options)
+        except ImportError:
+            # python-calamineが無い環境ではopenpyxlで読み込む
+            _uploaded_file.seek(0)
+            df = pd.read_excel(_uploaded_file, engine="openpyxl", **excel_options)
+        # 値の種類が少ない列は読み込み後にカテゴリ型にする（列の不足は検証で報告する）
+        df = df.astype(
+            {col: "category" for col in ("subject", "sc_year") if col in df.columns}
+        )
+
+    # データフレームの検証
+    validation_error, df = validate_dataframe(df)
+    if validation_error:
+        return None, validation_error, None
+    return df, None, df.head(5)
+
+
 def create_bulk_pdf():
     """まとめてPDF作成のUI"""
     st.subheader("まとめて作成")
@@ -130,93 +197,70 @@ def create_bulk_pdf():
 
     if uploaded_file:
         try:
-            # ファイルの読み込みとエンコーディング検出
-            if uploaded_file.type == "text/csv":
-                encoding = detect_encoding(uploaded_file)
-                df = pd.read_csv(
-                    uploaded_file,
-                    encoding=encoding,
-                    dtype = {
-                        'subject': str,
-                        'test_name': str,
-                        'score': int,
-                        'sc_year': str,
-                        'last_name': str,
-                        'first_name': str
-                    }
-                )
-            else:  # Excel
-                df = pd.read_excel(uploaded_file)
-
-            # データフレームの検証
-            validation_error = validate_dataframe(df, REQUIRED_COLUMNS)
+            # ファイルの読み込みと検証（同じファイルの再実行時はキャッシュを使う）
+            df, validation_error, preview = load_uploaded_file(
+                uploaded_file.file_id, uploaded_file
+            )
             if validation_error:
                 st.error(validation_error)
                 return
 
             # データプレビューの表示
             st.write("データプレビュー:")
-            st.dataframe(df.head(), use_container_width=True, hide_index=True)
+            st.dataframe(preview, use_container_width=True, hide_index=True)
 
             if st.button("PDFを一括生成", use_container_width=True):
-                pdfs = []
                 progress_text = "PDFを生成中..."
                 progress_bar = st.progress(0, text=progress_text)
 
                 try:
-                    # 一時ディレクトリの作成
-                    with tempfile.TemporaryDirectory() as temp_dir:
-                        # 各行のPDFを生成
-                        for i, row in df.iterrows():
+                    # PDF生成用のデータ作成
+                    rows = [
+                        {
+                            "subject": str(row["subject"]).strip(),
+                            "test_name": str(row["test_name"]).strip(),
+                            "score": int(row["score"]),
+                            "sc_year": str(row["sc_year"]).strip(),
+                            "last_name": str(row["last_name"]).strip(),
+                            "first_name": str(row["first_name"]).strip(),
+                            "template_type": st.session_state.template_type
+                        }
+                        for row in df[REQUIRED_COLUMNS].to_dict("records")
+                    ]
+
+                    # ZIPファイルをメモリ上に作成（PDFは圧縮が効かないため無圧縮）
+                    zip_filename = (
+                        f"成績表_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+                    )
+                    zip_buffer = io.BytesIO()
+                    # 進捗表示は1%刻みで更新する
+                    progress_step = max(1, len(df) // 100)
+                    # 件数が少なければ起動済みのブラウザで生成し、多ければ複数のプロセスで生成
+                    if len(rows) < PARALLEL_MIN_ROWS:
+                        pdfs = get_renderer().run_batch(rows)
+                    else:
+                        pdfs = generate_pdfs_parallel(rows)
+                    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_STORED) as zip_file:
+                        for i, (row, pdf_data) in enumerate(zip(rows, pdfs)):
                             # 進捗状況の更新
-                            progress = (i + 1) / len(df)
-                            progress_bar.progress(
-                                progress, text=f"{progress_text} ({i+1}/{len(df)})"
-                            )
-
-                            # PDF生成用のデータ作成
-                            input_values = {
-                                "subject": str(row["subject"]).strip(),
-                                "test_name": str(row["test_name"]).strip(),
-                                "score": int(row["score"]),
-                                "sc_year": str(row["sc_year"]).strip(),
-                                "last_name": str(row["last_name"]).strip(),
-                                "first_name": str(row["first_name"]).strip(),
-                                "template_type": st.session_state.template_type
-                            }
-
-                            # PDF生成
-                            pdf_data = generate_pdf(input_values)
+                            if (i + 1) % progress_step == 0 or i == len(df) - 1:
+                                progress = (i + 1) / len(df)
+                                progress_bar.progress(
+                                    progress, text=f"{progress_text} ({i+1}/{len(df)})"
+                                )
+
                             filename = f"{row['last_name']}{row['first_name']}_{row['subject']}.pdf"
-                            pdf_path = os.path.join(temp_dir, filename)
-
-                            # 一時ファイルとして保存
-                            with open(pdf_path, "wb") as f:
-                                f.write(pdf_data)
-                            pdfs.append((pdf_path, filename))
-
-                        # ZIPファイルの作成
-                        zip_filename = (
-                            f"成績表_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-                        )
-                        zip_path = os.path.join(temp_dir, zip_filename)
-
-                        with zipfile.ZipFile(zip_path, "w") as zip_file:
-                            for pdf_path, filename in pdfs:
-                                zip_file.write(pdf_path, filename)
-
-                        # ZIPファイルの読み込みとダウンロードボタンの表示
-                        with open(zip_path, "rb") as f:
-                            zip_data = f.read()
-
-                        st.success(f"全{len(df)}件のPDF生成が完了しました")
-                        st.download_button(
-                            "ZIPファイルをダウンロード",
-                            zip_data,
-                            zip_filename,
-                            mime="application/zip",
-                            use_container_width=True,
-                        )
+                            zip_file.writestr(filename, pdf_data)
+
+                    # ダウンロードボタンの表示
+                    st.success(f"全{len(df)}件のPDF生成が完了しました")
+                    st.download_button(
+                        "ZIPファイルをダウンロード",
+                        zip_buffer.getvalue(),
+                        zip_filename,
+                        mime="application/zip",
+                        use_container_width=True,
+                    )
 
                 except Exception as e:
                     st.error(f"PDF生成中にエラーが発生しました: {str(e)}")
@@ -228,6 +272,22 @@ def create_bulk_pdf():
 
 
 def main():
+    # 画面の初期化はmain()で行い、PDF生成のワーカープロセスがこのファイルを
+    # 読み込んだ（__mp_main__として実行された）ときには行わない
+    # ページ設定
+    st.set_page_config(page_title="成績表PDF生成アプリ", page_icon="📊", layout="wide")
+
+    # Playwrightのブラウザインストール（成功するまで再実行のたびに試す）
+    try:
+        install_playwright_browser()
+    except Exception:
+        # エラーは出力済み。画面の表示は続ける
+        pass
+
+    # セッション状態の初期化
+    if "generated_pdfs" not in st.session_state:
+        st.session_state.generated_pdfs = []
+
     st.title("成績表PDF生成アプリ")
 
     # モード選択
@@ -1,6 +1,5 @@
 import os
 from typing import Dict, Any, Optional
-from .generator import generate_pdf
 
 # バージョン情報
 __version__ = "1.0.0"
@@ -104,6 +103,9 @@ def create_pdf(data: Dict[str, Any], config: Optional[Dict[str, Any]] = None) ->
     Returns:
         bytes: 生成されたPDFデータ
     """
+    # generatorはテンプレートパスの取得にこのモジュールを使うため、ここで読み込む
+    from .generator import generate_pdf
+
     # 設定の初期化
     current_config = DEFAULT_CONFIG.copy()
     if config:
@@ -1,9 +1,15 @@
 import asyncio
 import base64
+import functools
+import multiprocessing
 import os
 import re
-from typing import Dict, Any
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from string import Template
+from typing import Dict, Any, Iterable, Iterator, List, Optional
 from playwright.async_api import async_playwright
+from . import get_template_path
 
 # 固定サイズ定数
 FONT_SIZES = {"name": 36, "year": 36, "honorific": 29}  # 姓名用  # 学年用  # さん用
@@ -16,6 +22,21 @@ LAYOUT = {
     "name_space": 18,  # 姓名間の余白
 }
 
+# Chromiumの起動オプション（PDF生成用のヘッドレス設定）
+CHROMIUM_ARGS = [
+    "--no-sandbox",
+    "--disable-setuid-sandbox",
+    "--disable-dev-shm-usage",  # コンテナの小さい/dev/shmを使わない
+    "--disable-gpu",
+    "--font-render-hinting=none",
+    "--disable-extensions",
+]
+
+# PDF生成のバックエンド
+# - "chromium": Playwright経由のヘッドレスChromium（既定）
+# - "weasyprint": WeasyPrintでプロセス内で生成（要 weasyprint パッケージ）
+PDF_BACKENDS = ("chromium", "weasyprint")
+
 # 教科と画像のマッピング
 SUBJECT_IMAGES = {
     "国語": {"medal": "n_lang1.png", "ribbon": "n_lang2.png"},
@@ -34,70 +55,110 @@ MULTILINE_SUBJECTS = {"技術家庭": "技術\n家庭", "保健体育": "保健\
 
 def encode_image_to_base64(image_path: str) -> str:
     """画像ファイルをBase64エンコード"""
-    try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode("utf-8")
-    except Exception as e:
-        print(f"Warning: Could not load image {image_path}: {e}")
-        return ""
+    with open(image_path, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode("utf-8")
+
+
+def _all_template_images():
+    """テンプレートで使う全画像のファイル名"""
+    filenames = {"crest.png", "twinkle.png"}
+    for images in SUBJECT_IMAGES.values():
+        filenames.update(images.values())
+    return sorted(filenames)
+
+
+def _validate_template_images():
+    """テンプレート画像がすべて存在するか確認"""
+    missing = [
+        filename
+        for filename in _all_template_images()
+        if not os.path.isfile(get_template_path("images", filename))
+    ]
+    if missing:
+        raise FileNotFoundError(
+            f"テンプレート画像が見つかりません: {', '.join(missing)}"
+        )
 
 
-async def generate_pdf_async(html_with_css):
-    """PDFを非同期で生成"""
-    try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(
-                headless=True,
-                args=['--no-sandbox', '--disable-setuid-sandbox']
-            )
-            page = await browser.new_page()
-            await page.set_viewport_size({"width": 842, "height": 595})
-            await page.set_content(html_with_css, wait_until="networkidle")
-            await page.wait_for_timeout(1000)
-            pdf_data = await page.pdf(
-                width="842px",
-                height="595px",
-                print_background=True,
-                margin={"top": "0", "right": "0", "bottom": "0", "left": "0"},
-            )
-            await browser.close()
-            return pdf_data
-    except Exception as e:
-        print(f"PDF generation error: {str(e)}")
-        raise
+# Base64エンコード済みの画像（起動時に一度だけ読み込む）
+_validate_template_images()
+_B64_IMAGES = {
+    filename: encode_image_to_base64(get_template_path("images", filename))
+    for filename in _all_template_images()
+}
 
 
-def generate_pdf(data: Dict[str, Any]) -> bytes:
+def _load_template(template_type: str, filename: str) -> str:
+    """テンプレートファイルを読み込む"""
+    with open(get_template_path(template_type, filename), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+# CSS内の画像URLを置換する正規表現
+_MEDAL_RE = re.compile(r'(\.medal\s*{[^}]*background:\s*)url\("[^"]*"\)([^}]*})')
+_RIBBON_RE = re.compile(r'(\.ribbon\s*{[^}]*background:\s*)url\("[^"]*"\)([^}]*})')
+
+# HTMLへの差し込み項目
+_HTML_FIELDS = ("sc_year", "last_name", "first_name", "subject", "test_name", "score")
+
+
+def _build_css_template() -> Template:
+    """画像URLをプレースホルダーに置き換えたCSSテンプレートを作成"""
+    css_content = _load_template("css", "main.css")
+    css_content = _MEDAL_RE.sub(r'\1url("data:image/png;base64,${medal}")\2', css_content)
+    css_content = _RIBBON_RE.sub(r'\1url("data:image/png;base64,${ribbon}")\2', css_content)
+    css_content = css_content.replace(
+        'url("../images/crest.png")', 'url("data:image/png;base64,${crest}")'
+    )
+    css_content = css_content.replace(
+        'url("../images/twinkle.png")', 'url("data:image/png;base64,${twinkle}")'
+    )
+    return Template(css_content)
+
+
+def _build_body_template() -> str:
+    """差し込み箇所をプレースホルダーに置き換えた<body>の中身を作成"""
+    html_content = _load_template("html", "index.html")
+    body_content = html_content.split("<body>")[1].split("</body>")[0]
+    for field in _HTML_FIELDS:
+        body_content = body_content.replace(f"[{field}]{{.{field}}}", f"${{{field}}}")
+    return body_content
+
+
+# テンプレート（起動時に一度だけ作成する）
+_CSS_TEMPLATE = _build_css_template()
+_BODY_TEMPLATE = _build_body_template()
+
+
+@functools.lru_cache(maxsize=32)
+def _build_template(subject: str, template_type: Optional[str]) -> Template:
     """
-    PDFを生成する
+    教科とテンプレートタイプごとのHTMLテンプレートを作成
+
+    教科・テンプレートタイプ以外の項目はプレースホルダーのまま残し、
+    作成結果はキャッシュする。
 
     Args:
-        data: PDF生成に必要なデータ
-            - subject: 教科名
-            - test_name: テスト名
-            - score: 点数
-            - sc_year: 学年
-            - last_name: 姓
-            - first_name: 名
-            - template_type: テンプレートタイプ
-                - "得点掲示": 通常の点数表示
-                - "点数アップ掲示": 点数の後ろにUPを表示
+        subject: 教科名
+        template_type: テンプレートタイプ
 
     Returns:
-        bytes: 生成されたPDFデータ
+        Template: CSSを埋め込んだHTMLテンプレート
     """
-    from . import get_template_path
-
-    # CSSファイルを読み込み（一度だけ読み込む）
-    with open(get_template_path("css", "main.css"), "r", encoding="utf-8") as f:
-        css_content = f.read()
+    # 教科に対応する画像の設定
+    subject_images = SUBJECT_IMAGES.get(subject, SUBJECT_IMAGES["国語"])
 
-    # HTMLテンプレートを読み込み
-    with open(get_template_path("html", "index.html"), "r", encoding="utf-8") as f:
-        html_content = f.read()
+    # 画像をBase64のデータURLとして埋め込む
+    css_content = _CSS_TEMPLATE.substitute(
+        medal=_B64_IMAGES[subject_images["medal"]],
+        crest=_B64_IMAGES["crest.png"],
+        ribbon=_B64_IMAGES[subject_images["ribbon"]],
+        twinkle=_B64_IMAGES["twinkle.png"],
+    )
+    html_content = _BODY_TEMPLATE
 
     # テンプレートタイプに応じた修正
-    if data.get("template_type") == "点数アップ掲示":
+    if template_type == "点数アップ掲示":
         additional_css = """
         /* スコア全体のレイアウト調整 */
         .score-container {
@@ -158,44 +219,10 @@ def generate_pdf(data: Dict[str, Any]) -> bytes:
             '<span class="point point-up"><span class="ten">点</span><span class="up">UP</span></span>',
         )
 
-    # HTMLコンテンツを更新
-    subject = data["subject"]
-    html_content = html_content.replace("[sc_year]{.sc_year}", str(data["sc_year"]))
-    html_content = html_content.replace("[last_name]{.last_name}", str(data["last_name"]))
-    html_content = html_content.replace("[first_name]{.first_name}", str(data["first_name"]))
-    html_content = html_content.replace("[subject]{.subject}", str(data["subject"]))
-    html_content = html_content.replace("[test_name]{.test_name}", str(data["test_name"]))
-    html_content = html_content.replace("[score]{.score}", str(data["score"]))
-
-    # 教科に対応する画像の設定
-    subject_images = SUBJECT_IMAGES.get(subject, SUBJECT_IMAGES["国語"])
-
-    # 画像をBase64エンコード
-    image_files = {
-        "medal": encode_image_to_base64(get_template_path("images", subject_images["medal"])),
-        "crest": encode_image_to_base64(get_template_path("images", "crest.png")),
-        "ribbon": encode_image_to_base64(get_template_path("images", subject_images["ribbon"])),
-        "twinkle": encode_image_to_base64(get_template_path("images", "twinkle.png")),
-    }
-
-    # 画像パスをBase64に置換
-    css_content = re.sub(
-        r'(\.medal\s*{[^}]*background:\s*)url\("[^"]*"\)([^}]*})',
-        f'\\1url("data:image/png;base64,{image_files["medal"]}")\\2',
-        css_content,
-    )
-    css_content = re.sub(
-        r'(\.ribbon\s*{[^}]*background:\s*)url\("[^"]*"\)([^}]*})',
-        f'\\1url("data:image/png;base64,{image_files["ribbon"]}")\\2',
-        css_content,
-    )
-    css_content = css_content.replace(
-        'url("../images/crest.png")',
-        f'url("data:image/png;base64,{image_files["crest"]}")',
-    )
-    css_content = css_content.replace(
-        'url("../images/twinkle.png")',
-        f'url("data:image/png;base64,{image_files["twinkle"]}")',
+    # 教科名を差し込む（改行が必要な教科は改行入りの表記にする）
+    subject_label = MULTILINE_SUBJECTS.get(subject, subject)
+    html_content = Template(html_content).safe_substitute(
+        subject=subject_label.replace("$", "$$")
     )
 
     # リボンエリアのCSS追加
@@ -314,13 +341,6 @@ def generate_pdf(data: Dict[str, Any]) -> bytes:
             }
         """
 
-    # 改行が必要な教科の処理
-    if subject in MULTILINE_SUBJECTS:
-        html_content = html_content.replace(
-            f'<span class="subject">{subject}</span>',
-            f'<span class="subject">{MULTILINE_SUBJECTS[subject]}</span>',
-        )
-
     # Create final HTML
     html_with_css = f"""
     <!DOCTYPE html>
@@ -340,12 +360,258 @@ def generate_pdf(data: Dict[str, Any]) -> bytes:
             </style>
         </head>
         <body>
-            {html_content.split('<body>')[1].split('</body>')[0]}
+            {html_content}
         </body>
     </html>
     """
 
-    return asyncio.run(generate_pdf_async(html_with_css))
+    return Template(html_with_css)
+
+
+def build_html(data: Dict[str, Any]) -> str:
+    """
+    PDF化するHTMLを組み立てる
+
+    Args:
+        data: PDF生成に必要なデータ（generate_pdfと同じ形式）
+
+    Returns:
+        str: CSSを埋め込んだHTML
+    """
+    template = _build_template(data["subject"], data.get("template_type"))
+    return template.safe_substitute(
+        sc_year=data["sc_year"],
+        last_name=data["last_name"],
+        first_name=data["first_name"],
+        test_name=data["test_name"],
+        score=data["score"],
+    )
+
+
+def render_with_weasyprint(html_with_css: str) -> bytes:
+    """WeasyPrintでHTMLからPDFを生成"""
+    try:
+        from weasyprint import CSS, HTML
+    except ImportError as e:
+        raise RuntimeError("WeasyPrintがインストールされていません") from e
+
+    page_css = CSS(string="@page { size: 842px 595px; margin: 0; }")
+    return HTML(string=html_with_css).write_pdf(stylesheets=[page_css])
+
+
+class PdfRenderer:
+    """
+    Chromiumを1度だけ起動して使い回すPDFレンダラー
+
+    ブラウザは専用スレッドのイベントループ上で保持し、
+    PDFごとに新しいページを開いて生成する。
+    同時に開くページ数はmax_concurrencyまでに制限する。
+    backendに"weasyprint"を指定した場合はブラウザを使わずに生成する。
+    """
+
+    def __init__(
+        self, max_concurrency: Optional[int] = None, backend: str = "chromium"
+    ):
+        if backend not in PDF_BACKENDS:
+            raise ValueError(f"未対応のバックエンドです: {backend}")
+        self.backend = backend
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        # イベントループとスレッドはChromiumを使う場合だけ用意する
+        self._loop = None
+        self._thread = None
+        if backend == "chromium":
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._loop.run_forever, daemon=True
+            )
+            self._thread.start()
+        self._playwright = None
+        self._browser = None
+        self._launch_lock = None
+        self._semaphore = None
+
+    async def _get_browser(self):
+        """ブラウザを取得（未起動なら起動する）"""
+        if self._launch_lock is None:
+            self._launch_lock = asyncio.Lock()
+        async with self._launch_lock:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(
+                    headless=True, args=CHROMIUM_ARGS
+                )
+        return self._browser
+
+    async def _render_async(self, data: Dict[str, Any]) -> bytes:
+        """PDFを非同期で生成"""
+        html_with_css = build_html(data)
+        try:
+            browser = await self._get_browser()
+            page = await browser.new_page()
+            try:
+                await page.set_viewport_size({"width": 842, "height": 595})
+                await page.set_content(html_with_css, wait_until="networkidle")
+                # Webフォントの読み込み完了を待つ
+                await page.evaluate("document.fonts.ready")
+                return await page.pdf(
+                    width="842px",
+                    height="595px",
+                    print_background=True,
+                    margin={"top": "0", "right": "0", "bottom": "0", "left": "0"},
+                )
+            finally:
+                await page.close()
+        except Exception as e:
+            print(f"PDF generation error: {str(e)}")
+            raise
+
+    async def _render_limited(self, data: Dict[str, Any]) -> bytes:
+        """同時実行数を制限してPDFを生成"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            return await self._render_async(data)
+
+    def _submit(self, coro):
+        """レンダラーのイベントループにコルーチンを投入する"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def _run(self, coro):
+        """レンダラーのイベントループでコルーチンを実行して結果を待つ"""
+        return self._submit(coro).result()
+
+    def render(self, data: Dict[str, Any]) -> bytes:
+        """
+        PDFを1件生成する
+
+        Args:
+            data: PDF生成に必要なデータ（generate_pdfと同じ形式）
+
+        Returns:
+            bytes: 生成されたPDFデータ
+        """
+        if self.backend == "weasyprint":
+            return render_with_weasyprint(build_html(data))
+        return self._run(self._render_limited(data))
+
+    def run_batch(self, data_list: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+        """
+        同じブラウザで複数のPDFを並行して生成する
+
+        Args:
+            data_list: PDF生成に必要なデータのリスト
+
+        Yields:
+            bytes: 生成されたPDFデータ（入力と同じ順序）
+        """
+        if self.backend == "weasyprint":
+            for data in data_list:
+                yield self.render(data)
+            return
+
+        # 全件をまとめて投入し、入力順に結果を返す
+        futures = [self._submit(self._render_limited(data)) for data in data_list]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # 途中で中断された場合は残りをキャンセル
+            for future in futures:
+                future.cancel()
+
+    async def _close_async(self):
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def close(self):
+        """ブラウザとイベントループを終了する"""
+        if self._loop is None:
+            return
+        try:
+            self._run(self._close_async())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+
+def generate_pdf(data: Dict[str, Any], backend: str = "chromium") -> bytes:
+    """
+    PDFを生成する
+
+    Args:
+        data: PDF生成に必要なデータ
+            - subject: 教科名
+            - test_name: テスト名
+            - score: 点数
+            - sc_year: 学年
+            - last_name: 姓
+            - first_name: 名
+            - template_type: テンプレートタイプ
+                - "得点掲示": 通常の点数表示
+                - "点数アップ掲示": 点数の後ろにUPを表示
+        backend: PDF生成のバックエンド（PDF_BACKENDSのいずれか）
+
+    Returns:
+        bytes: 生成されたPDFデータ
+    """
+    if backend == "weasyprint":
+        return render_with_weasyprint(build_html(data))
+
+    renderer = PdfRenderer(backend=backend)
+    try:
+        return renderer.render(data)
+    finally:
+        renderer.close()
+
+
+# ワーカープロセスごとのレンダラー
+_worker_renderer = None
+
+
+def _render_chunk(data_list: List[Dict[str, Any]]) -> List[bytes]:
+    """ワーカープロセスでPDFを生成（ブラウザはプロセス内で使い回す）"""
+    global _worker_renderer
+    if _worker_renderer is None:
+        _worker_renderer = PdfRenderer()
+    return list(_worker_renderer.run_batch(data_list))
+
+
+def generate_pdfs_parallel(
+    data_list: Iterable[Dict[str, Any]],
+    max_workers: Optional[int] = None,
+    chunksize: int = 4,
+) -> Iterator[bytes]:
+    """
+    複数のプロセスでPDFをまとめて生成する
+
+    Args:
+        data_list: PDF生成に必要なデータのリスト
+        max_workers: ワーカープロセス数（省略時はCPUコア数）
+        chunksize: 1回でワーカーに渡す件数
+
+    Yields:
+        bytes: 生成されたPDFデータ（入力と同じ順序）
+    """
+    data_list = list(data_list)
+    chunks = [
+        data_list[i : i + chunksize] for i in range(0, len(data_list), chunksize)
+    ]
+    if not chunks:
+        return
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(chunks))
+    # Playwrightのスレッドを持つプロセスからforkしないよう、spawnでワーカーを起動する
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        for pdfs in executor.map(_render_chunk, chunks):
+            yield from pdfs
 
 
 if __name__ == "__main__":
@@ -358,4 +624,4 @@ if __name__ == "__main__":
         "last_name": "山田",
         "first_name": "太郎",
     }
-    asyncio.run(generate_pdf(test_data))
+    generate_pdf(test_data)
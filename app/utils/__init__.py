@@ -14,6 +14,7 @@ __version__ = "1.0.0"
 ALLOWED_EXTENSIONS = {".csv", ".xlsx"}
 ALLOWED_ENCODINGS = {"utf-8", "shift-jis", "shift_jis"}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+ENCODING_SAMPLE_SIZE = 64 * 1024  # エンコーディング判定に使う先頭のサイズ（64KB）
 
 # カラム定義
 REQUIRED_COLUMNS = [
@@ -46,16 +47,16 @@ def detect_encoding(file_obj: Union[BinaryIO, bytes]) -> str:
         FileProcessError: エンコーディング検出に失敗した場合
     """
     try:
-        # ファイルポインタを先頭に戻す
+        # 先頭部分だけを読み込む
         if hasattr(file_obj, "seek"):
             file_obj.seek(0)
-            raw_data = file_obj.read()
+            raw_data = file_obj.read(ENCODING_SAMPLE_SIZE)
         else:
-            raw_data = file_obj
+            raw_data = file_obj[:ENCODING_SAMPLE_SIZE]
 
         # エンコーディングを検出
         result = chardet.detect(raw_data)
-        detected_encoding = result["encoding"].lower()
+        detected_encoding = (result["encoding"] or "utf-8").lower()
 
         # 許可されたエンコーディングかチェック
         if detected_encoding in ALLOWED_ENCODINGS:
@@ -88,23 +89,24 @@ def validate_dataframe(df: pd.DataFrame) -> Optional[str]:
         return f"必須カラムが不足しています: {', '.join(missing_columns)}"
 
     try:
-        # 点数を数値型に変換
-        df["score"] = pd.to_numeric(df["score"])
+        # 点数を数値型に変換（数値でない値はNaNとなり範囲外として扱う）
+        scores = pd.to_numeric(df["score"], errors="coerce")
 
         # 点数の範囲チェック
-        invalid_scores = df[~df["score"].between(0, 100)]
-        if not invalid_scores.empty:
+        if not scores.between(0, 100).all():
             return "点数は0から100の間である必要があります"
+        df["score"] = scores
 
         # 必須項目の入力チェック
-        for col in REQUIRED_COLUMNS:
-            if df[col].isna().any():
-                return f"{col}に空の値が含まれています"
+        na_columns = df[REQUIRED_COLUMNS].isna().any()
+        if na_columns.any():
+            return f"{na_columns[na_columns].index[0]}に空の値が含まれています"
 
         # 教科名のチェック
-        invalid_subjects = set(df["subject"]) - set(VALID_SUBJECTS.keys())
-        if invalid_subjects:
-            return f"無効な教科名が含まれています: {', '.join(invalid_subjects)}"
+        subjects = df["subject"]
+        invalid_subjects = subjects[~subjects.isin(list(VALID_SUBJECTS))].unique()
+        if len(invalid_subjects) > 0:
+            return f"無効な教科名が含まれています: {', '.join(map(str, invalid_subjects))}"
 
     except Exception as e:
         return f"データの検証中にエラーが発生しました: {str(e)}"
@@ -141,12 +143,19 @@ def process_file(file_obj: BinaryIO, file_extension: str) -> pd.DataFrame:
             encoding = detect_encoding(file_obj)
             df = pd.read_csv(file_obj, encoding=encoding)
         elif file_extension.lower() == ".xlsx":
-            df = pd.read_excel(file_obj)
+            # 必要な列だけを読み込む
+            df = pd.read_excel(
+                file_obj,
+                engine="openpyxl",
+                usecols=lambda col: col in REQUIRED_COLUMNS,
+            )
         else:
             raise FileProcessError("サポートされていないファイル形式です")
 
-        # データの整形
-        df = df.map(lambda x: str(x).strip() if isinstance(x, str) else x)
+        # データの整形（文字列の前後の空白を削除し、文字列以外の値はそのまま残す）
+        for col in df.select_dtypes(include="object").columns:
+            stripped = df[col].str.strip()
+            df[col] = df[col].where(stripped.isna(), stripped)
 
         # バリデーション
         error_msg = validate_dataframe(df)
@@ -1,130 +1,429 @@
+import codecs
+import threading
 import pandas as pd
-import chardet
-from typing import Optional, List
+from typing import Optional, Dict, Tuple, FrozenSet, Final
 import io
 
+# エンコーディング判定にはC実装のcchardetを優先し、無ければcharset-normalizerを使う
+try:
+    from cchardet import detect as cchardet_detect
+except ImportError:
+    cchardet_detect = None
+    from charset_normalizer import from_bytes
+
+# pyarrowがあればマルチスレッドのCSVリーダーを使う
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+    pacsv = None
+
+# Polarsは任意の依存関係（process_uploaded_fileでuse_polars=Trueの場合に使う）
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# エンコーディング判定用の設定
+ENCODING_SAMPLE_LIMIT = 256 * 1024  # 判定に使う最大サイズ（256KiB）
+ALLOWED_ENCODINGS = {"utf-8", "shift_jis", "cp932"}  # codecsの正規名
+
+# BOMとエンコーディングの対応（読み込み時にBOMを取り除くエンコーディング名）
+BOM_ENCODINGS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# 必須カラム（列がこの順で揃っているかは_REQUIRED_INDEXとの比較で判定する）
+REQUIRED_COLS: Final[Tuple[str, ...]] = (
+    "subject",
+    "test_name",
+    "score",
+    "sc_year",
+    "last_name",
+    "first_name",
+)
+_REQUIRED_INDEX = pd.Index(REQUIRED_COLS)
+
+# 大きなCSVは分割して読み込む
+LARGE_FILE_THRESHOLD_BYTES = 50 * 1024 * 1024  # 50MB
+AUTO_CHUNK_SIZE = 200_000  # 1回に読み込む行数
+
+# 文字列として読み込むカラム
+STRING_COLUMN_DTYPES = {
+    "subject": "string",
+    "test_name": "string",
+    "sc_year": "string",
+    "last_name": "string",
+    "first_name": "string",
+}
+
+# 整形後のカラムの型（値の種類が少ないカラムはカテゴリ型にする）
+COLUMN_DTYPES = {
+    "subject": "category",
+    "sc_year": "category",
+    "test_name": "category",
+    "last_name": "string",
+    "first_name": "string",
+}
+
+# 有効な教科名
+VALID_SUBJECTS: FrozenSet[str] = frozenset(
+    {"国語", "数学", "社会", "理科", "英語", "技術家庭", "音楽", "保健体育"}
+)
+
+# 空の値を許可しないカラム
+REQUIRED_NON_NULL: Tuple[str, ...] = (
+    "subject",
+    "test_name",
+    "sc_year",
+    "last_name",
+    "first_name",
+)
+
+# アップロードファイルごとのエンコーディング判定結果
+ENCODING_CACHE_SIZE = 32
+_ENCODING_CACHE: Dict[Tuple[str, int], str] = {}
+_ENCODING_CACHE_LOCK = threading.Lock()  # 複数セッションからの同時更新を防ぐ
+
 
 def detect_encoding(file_obj: io.BytesIO) -> str:
     """
     ファイルのエンコーディングを検出する
 
+    StreamlitのUploadedFileのようにfile_idを持つファイルは、
+    判定結果をキャッシュして再実行時に使い回す。
+    別のアップロード（file_idが異なるもの）はキャッシュを使わない。
+
     Args:
         file_obj: バイナリモードで開いたファイルオブジェクト
 
     Returns:
         str: 検出されたエンコーディング
     """
-    # ファイルポインタを先頭に戻す
-    file_obj.seek(0)
-    raw_data = file_obj.read()
+    file_id = getattr(file_obj, "file_id", None)
+    if file_id is None:
+        return _sniff_encoding(file_obj)
+
+    cache_key = (file_id, getattr(file_obj, "size", -1))
+    with _ENCODING_CACHE_LOCK:
+        encoding = _ENCODING_CACHE.get(cache_key)
+    if encoding is None:
+        encoding = _sniff_encoding(file_obj)
+        with _ENCODING_CACHE_LOCK:
+            # 上限を超えたら古いものから削除
+            if len(_ENCODING_CACHE) >= ENCODING_CACHE_SIZE:
+                _ENCODING_CACHE.pop(next(iter(_ENCODING_CACHE)))
+            _ENCODING_CACHE[cache_key] = encoding
+    return encoding
+
+
+def _detect(raw_data: bytes) -> Optional[str]:
+    """バイト列のエンコーディングを判定（cchardetがあれば優先して使う）"""
+    if cchardet_detect is not None:
+        return cchardet_detect(raw_data)["encoding"]
+    best = from_bytes(raw_data).best()
+    return best.encoding if best is not None else None
 
-    # エンコーディングを検出
-    result = chardet.detect(raw_data)
-    encoding = result["encoding"]
 
-    # UTF-8とShift-JIS以外の場合はUTF-8として扱う
-    if encoding.lower() not in ["utf-8", "shift-jis", "shift_jis"]:
-        encoding = "utf-8"
+def _sniff_encoding(file_obj: io.BytesIO) -> str:
+    """ファイルの先頭部分からエンコーディングを判定する"""
+    if hasattr(file_obj, "getvalue"):
+        # バッファを持つファイルはファイルポインタを動かさずに参照する
+        raw_data = file_obj.getvalue()
+    else:
+        raw_data = _sample_stream(file_obj)
+    return detect_encoding_from_bytes(_encoding_sample(raw_data))
 
-    # ファイルポインタを先頭に戻す
+
+def _sample_stream(file_obj) -> bytes:
+    """ファイルの先頭部分だけを読み込み、ファイルポインタを先頭に戻す"""
     file_obj.seek(0)
-    return encoding
+    try:
+        # 途中で切れたかどうかを判定できるよう1バイト多く読む
+        return file_obj.read(ENCODING_SAMPLE_LIMIT + 1)
+    finally:
+        file_obj.seek(0)
+
+
+def _encoding_sample(raw_data: bytes) -> bytes:
+    """
+    エンコーディング判定に使う先頭部分を切り出す
+
+    上限で切れる場合は最後の改行までにし、複数バイト文字の途中で
+    切れないようにする（Shift-JISの2バイト目に0x0Aは現れない）。
+
+    Args:
+        raw_data: ファイルの内容（または先頭部分）
+
+    Returns:
+        bytes: 判定に使うバイト列
+    """
+    if len(raw_data) <= ENCODING_SAMPLE_LIMIT:
+        return raw_data
+    sample = raw_data[:ENCODING_SAMPLE_LIMIT]
+    end = sample.rfind(b"\n")
+    return sample[: end + 1] if end >= 0 else sample
 
 
-def validate_dataframe(df: pd.DataFrame, required_columns: List[str]) -> Optional[str]:
+def detect_encoding_from_bytes(raw_data: bytes) -> str:
+    """
+    バイト列のエンコーディングを検出する
+
+    BOMがある場合やASCIIのみの場合は判定器を使わない。
+
+    Args:
+        raw_data: 判定に使うバイト列（ファイルの先頭部分）
+
+    Returns:
+        str: 検出されたエンコーディング
+    """
+    # BOM付きのファイルはBOMからエンコーディングを決める
+    for bom, bom_encoding in BOM_ENCODINGS:
+        if raw_data.startswith(bom):
+            return bom_encoding
+
+    # ASCIIのみのファイルはUTF-8として扱う
+    if raw_data.isascii():
+        return "utf-8"
+
+    encoding = _detect(raw_data)
+
+    # UTF-8とShift-JIS以外（判定できなかった場合を含む）はUTF-8として扱う
+    if encoding is None:
+        return "utf-8"
+    try:
+        encoding = codecs.lookup(encoding).name
+    except LookupError:
+        return "utf-8"
+    return encoding if encoding in ALLOWED_ENCODINGS else "utf-8"
+
+
+def validate_dataframe(
+    df: pd.DataFrame,
+) -> Tuple[Optional[str], Optional[pd.DataFrame]]:
     """
     データフレームのバリデーションを行う
 
     Args:
-        df: 検証するデータフレーム
-        required_columns: 必須カラムのリスト
+        df: 検証するデータフレーム（必須カラムはREQUIRED_COLS）
 
     Returns:
-        Optional[str]: エラーメッセージ。問題なければNone
+        Tuple[Optional[str], Optional[pd.DataFrame]]:
+            (エラーメッセージ, 点数を数値型に変換したデータフレーム)。
+            問題なければエラーメッセージはNone、エラー時はデータフレームがNone
     """
-    # 必須カラムの存在チェック
-    missing_columns = set(required_columns) - set(df.columns)
-    if missing_columns:
-        return f"必須カラムが不足しています: {', '.join(missing_columns)}"
+    # 必須カラムの存在チェック（不足しているカラムを必須カラムの順で列挙する）
+    # 列が必須カラムと完全に一致する場合は確認を省略する
+    if not df.columns.equals(_REQUIRED_INDEX):
+        missing_columns = [col for col in REQUIRED_COLS if col not in df.columns]
+        if missing_columns:
+            return f"必須カラムが不足しています: {', '.join(missing_columns)}", None
 
     # データ型のチェック
     try:
-        # 点数を数値型に変換
-        df["score"] = pd.to_numeric(df["score"])
+        # 点数を数値型に変換（数値でない値はNaNになる）
+        score = pd.to_numeric(df["score"], errors="coerce")
+        if score.isna().any():
+            return "点数に数値でない値または空の値が含まれています", None
 
         # 点数の範囲チェック
-        if not df["score"].between(0, 100).all():
-            return "点数は0から100の間である必要があります"
+        if ((score < 0) | (score > 100)).any():
+            return "点数は0から100の間である必要があります", None
+
+        # 小数の点数は許可しない（整数型に変換できるようにする）
+        if (score % 1 != 0).any():
+            return "点数は整数である必要があります", None
+        df["score"] = score
 
         # 必須項目の入力チェック
-        for col in ["subject", "test_name", "sc_year", "last_name", "first_name"]:
-            if df[col].isna().any():
-                return f"{col}に空の値が含まれています"
+        na_columns = df[list(REQUIRED_NON_NULL)].isna().any()
+        if na_columns.any():
+            return f"{na_columns[na_columns].index[0]}に空の値が含まれています", None
 
         # 教科名のチェック
-        valid_subjects = [
-            "国語",
-            "数学",
-            "社会",
-            "理科",
-            "英語",
-            "技術家庭",
-            "音楽",
-            "保健体育",
-        ]
-        invalid_subjects = set(df["subject"]) - set(valid_subjects)
-        if invalid_subjects:
-            return f"無効な教科名が含まれています: {', '.join(invalid_subjects)}"
+        invalid_mask = ~df["subject"].isin(VALID_SUBJECTS)
+        if invalid_mask.any():
+            invalid_subjects = df.loc[invalid_mask, "subject"].unique()
+            return (
+                f"無効な教科名が含まれています: {', '.join(map(str, invalid_subjects))}",
+                None,
+            )
 
     except Exception as e:
-        return f"データの検証中にエラーが発生しました: {str(e)}"
+        return f"データの検証中にエラーが発生しました: {str(e)}", None
+
+    return None, df
+
+
+def _clean(df: pd.DataFrame) -> pd.DataFrame:
+    """文字列の前後の空白を削除し、文字列以外の値はそのまま残す"""
+    for col in df.select_dtypes(include=["object", "string"]).columns:
+        stripped = df[col].str.strip()
+        df[col] = df[col].where(stripped.isna(), stripped)
+    return df
+
+
+def _validated(df: pd.DataFrame) -> pd.DataFrame:
+    """検証して点数を数値型にしたデータフレームを返す（不正な場合はValueError）"""
+    error, df = validate_dataframe(df)
+    if error:
+        raise ValueError(error)
+    return df
 
+
+def _read_csv_with_pyarrow(raw_data: bytes, encoding: str) -> pd.DataFrame:
+    """pyarrowのCSVリーダーで読み込む（文字列カラムはpandasのstring型にする）"""
+    table = pacsv.read_csv(
+        pa.BufferReader(raw_data),
+        read_options=pacsv.ReadOptions(block_size=1 << 20, encoding=encoding),
+        convert_options=pacsv.ConvertOptions(
+            column_types={col: pa.string() for col in STRING_COLUMN_DTYPES},
+            strings_can_be_null=True,
+        ),
+    )
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype()}.get)
+
+
+def _read_csv_with_polars(raw_data: bytes, encoding: str) -> pd.DataFrame:
+    """Polarsで読み込み、文字列の前後の空白を削除してからpandasに変換する"""
+    string_columns = list(STRING_COLUMN_DTYPES)
+    df = pl.read_csv(
+        raw_data,
+        encoding="utf8" if encoding in ("utf-8", "utf-8-sig") else encoding,
+        schema_overrides={col: pl.Utf8 for col in string_columns},
+    )
+    present_columns = [col for col in string_columns if col in df.columns]
+    df = df.with_columns(pl.col(present_columns).str.strip_chars())
+    # 他の読み込み方法と同じく、文字列はpandasのstring型、数値はNumPyの型にする
+    return df.to_pandas(types_mapper=_string_types_mapper)
+
+
+def _string_types_mapper(arrow_type) -> Optional[pd.StringDtype]:
+    """Arrowの文字列型（large_stringを含む）をpandasのstring型に対応付ける"""
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype()
     return None
 
 
-def process_uploaded_file(uploaded_file) -> Optional[pd.DataFrame]:
+def _read_csv_in_chunks(buffer: io.BytesIO, encoding: str, chunksize: int) -> pd.DataFrame:
+    """CSVを分割して読み込み、チャンクごとに整形・検証する"""
+    chunks = []
+    try:
+        reader = pd.read_csv(
+            buffer,
+            encoding=encoding,
+            engine="c",
+            dtype=STRING_COLUMN_DTYPES,
+            chunksize=chunksize,
+        )
+    except Exception as e:
+        raise ValueError(f"CSVファイルの読み込みに失敗しました: {str(e)}") from e
+
+    while True:
+        # 読み込みのエラーだけをまとめ、検証のエラーはそのまま伝える
+        try:
+            chunk = next(reader)
+        except StopIteration:
+            break
+        except Exception as e:
+            raise ValueError(f"CSVファイルの読み込みに失敗しました: {str(e)}") from e
+        # 不正なデータがあれば全体を読み込む前に中断する
+        chunks.append(_validated(_clean(chunk)))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def process_uploaded_file(
+    uploaded_file, chunksize: Optional[int] = None, use_polars: bool = False
+) -> pd.DataFrame:
     """
     アップロードされたファイルを処理する
 
     Args:
         uploaded_file: Streamlitのアップロードファイルオブジェクト
+        chunksize: CSVを分割して読み込む行数（省略時は大きなファイルのみ分割）
+        use_polars: CSVをPolarsで読み込むかどうか（Polarsが無い場合は無視する）
 
     Returns:
-        Optional[pd.DataFrame]: 処理されたデータフレーム。エラー時はNone
+        pd.DataFrame: 処理されたデータフレーム
+
+    Raises:
+        ValueError: ファイルの読み込みまたはデータの検証に失敗した場合
     """
-    try:
-        # ファイルタイプに応じた読み込み
-        if uploaded_file.type == "text/csv":
-            # CSVファイルの場合、エンコーディングを検出して読み込み
-            encoding = detect_encoding(uploaded_file)
-            df = pd.read_csv(uploaded_file, encoding=encoding)
-        elif (
-            uploaded_file.type
-            == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        ):
-            # Excelファイルの場合
-            df = pd.read_excel(uploaded_file)
-        else:
-            raise ValueError("サポートされていないファイル形式です")
+    # ファイルタイプに応じた読み込み
+    if uploaded_file.type == "text/csv":
+        # CSVファイルの場合、エンコーディングを検出し、同じバッファから読み込み
+        encoding = detect_encoding(uploaded_file)
+        raw_data = uploaded_file.getvalue()
+        if chunksize is None and len(raw_data) > LARGE_FILE_THRESHOLD_BYTES:
+            chunksize = AUTO_CHUNK_SIZE
 
-        # データの整形
-        df = df.map(
-            lambda x: x.strip() if isinstance(x, str) else x
-        )  # 文字列の前後の空白を削除
+        if use_polars and pl is not None:
+            # Polarsでは読み込み時に空白を削除済み
+            try:
+                df = _read_csv_with_polars(raw_data, encoding)
+            except Exception as e:
+                raise ValueError(f"CSVファイルの読み込みに失敗しました: {str(e)}") from e
+            df = _validated(df)
+        elif chunksize:
+            # 分割読み込みではチャンクごとに整形・検証する
+            df = _read_csv_in_chunks(io.BytesIO(raw_data), encoding, chunksize)
+        else:
+            try:
+                if pacsv is not None:
+                    df = _read_csv_with_pyarrow(raw_data, encoding)
+                else:
+                    df = pd.read_csv(
+                        io.BytesIO(raw_data),
+                        encoding=encoding,
+                        engine="c",
+                        dtype=STRING_COLUMN_DTYPES,
+                    )
+            except Exception as e:
+                raise ValueError(f"CSVファイルの読み込みに失敗しました: {str(e)}") from e
+            df = _validated(_clean(df))
+    elif (
+        uploaded_file.type
+        == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    ):
+        # Excelファイルの場合（Rust実装のcalamineを優先して使う）
+        try:
+            try:
+                df = pd.read_excel(
+                    uploaded_file, engine="calamine", dtype=STRING_COLUMN_DTYPES
+                )
+            except (ImportError, ValueError):
+                # python-calamineが無い、またはpandasが未対応の場合はopenpyxlで読み込む
+                uploaded_file.seek(0)
+                df = pd.read_excel(uploaded_file, dtype=STRING_COLUMN_DTYPES)
+        except Exception as e:
+            raise ValueError(f"Excelファイルの読み込みに失敗しました: {str(e)}") from e
+        df = _validated(_clean(df))
+    else:
+        raise ValueError("サポートされていないファイル形式です")
 
-        # 必要なカラムの型変換
-        df["score"] = pd.to_numeric(df["score"], errors="coerce")
-        df["score"] = df["score"].astype(int)
+    # 検証済みの数値型の点数を整数型に変換（整数型になっていれば何もしない）
+    if df["score"].dtype.kind != "i":
+        df["score"] = pd.to_numeric(df["score"], downcast="integer")
 
-        # 文字列カラムの変換
-        string_columns = ["subject", "test_name", "sc_year", "last_name", "first_name"]
-        for col in string_columns:
-            df[col] = df[col].astype(str)
+    # 文字列カラムの型変換
+    return df.astype(COLUMN_DTYPES)
 
-        return df
 
-    except Exception as e:
-        raise Exception(f"ファイルの処理中にエラーが発生しました: {str(e)}")
+# サンプルデータ（開発・テスト用、起動時に一度だけ作成する）
+# カラムの型はprocess_uploaded_fileで処理したデータに合わせる
+_SAMPLE_DF = pd.DataFrame(
+    {
+        "subject": ["国語", "数学", "英語"],
+        "test_name": ["第1回定期考査"] * 3,
+        "score": [95, 88, 92],
+        "sc_year": ["小3"] * 3,
+        "last_name": ["山田", "鈴木", "佐藤"],
+        "first_name": ["太郎", "花子", "一郎"],
+    }
+).astype({**COLUMN_DTYPES, "score": "int32"})
 
 
 def create_sample_data() -> pd.DataFrame:
@@ -132,14 +431,6 @@ def create_sample_data() -> pd.DataFrame:
     サンプルデータを生成する（開発・テスト用）
 
     Returns:
-        pd.DataFrame: サンプルデータを含むデータフレーム
+        pd.DataFrame: サンプルデータを含むデータフレーム（呼び出しごとのコピー）
     """
-    data = {
-        "subject": ["国語", "数学", "英語"],
-        "test_name": ["第1回定期考査"] * 3,
-        "score": [95, 88, 92],
-        "sc_year": ["小3"] * 3,
-        "last_name": ["山田", "鈴木", "佐藤"],
-        "first_name": ["太郎", "花子", "一郎"],
-    }
-    return pd.DataFrame(data)
+    return _SAMPLE_DF.copy()
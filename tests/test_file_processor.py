@@ -0,0 +1,95 @@
+import io
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# アプリと同じくapp/を基準にインポートする
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from utils import file_processor  # noqa: E402
+from utils.file_processor import (  # noqa: E402
+    ENCODING_SAMPLE_LIMIT,
+    _encoding_sample,
+    detect_encoding,
+    process_uploaded_file,
+)
+
+CSV_HEADER = "subject,test_name,score,sc_year,last_name,first_name\n"
+
+
+class _UploadedCsv(io.BytesIO):
+    """StreamlitのUploadedFileの代わりに使うCSVファイル"""
+
+    type = "text/csv"
+
+
+def _read_with(reader: str, csv_text: str, monkeypatch):
+    """指定した読み込み方法でCSVを処理する"""
+    uploaded_file = _UploadedCsv((CSV_HEADER + csv_text).encode("utf-8"))
+    if reader == "polars":
+        if file_processor.pl is None:
+            pytest.skip("polarsがインストールされていません")
+        return process_uploaded_file(uploaded_file, use_polars=True)
+    if reader == "pyarrow":
+        if file_processor.pacsv is None:
+            pytest.skip("pyarrowがインストールされていません")
+    else:
+        monkeypatch.setattr(file_processor, "pacsv", None)
+    if reader == "chunks":
+        return process_uploaded_file(uploaded_file, chunksize=1)
+    return process_uploaded_file(uploaded_file)
+
+
+READERS = ["pandas", "pyarrow", "polars", "chunks"]
+
+
+def _shift_jis_csv_cut_mid_character() -> bytes:
+    """判定の上限位置が2バイト文字の途中になるShift-JISのCSVを作る"""
+    header = "subject,test_name,score,sc_year,last_name,first_name"
+    row = "国語,第1回定期考査,95,小3,山田,太郎\n".encode("cp932")
+    rows = row * (ENCODING_SAMPLE_LIMIT // len(row) + 2)
+    for pad in range(len(row)):
+        data = (header + " " * pad + "\n").encode("cp932") + rows
+        try:
+            data[:ENCODING_SAMPLE_LIMIT].decode("cp932")
+        except UnicodeDecodeError:
+            return data
+    raise AssertionError("文字の途中で切れるデータを作れませんでした")
+
+
+def test_encoding_sample_ends_on_line_boundary():
+    data = _shift_jis_csv_cut_mid_character()
+    sample = _encoding_sample(data)
+    assert len(sample) <= ENCODING_SAMPLE_LIMIT
+    assert sample.endswith(b"\n")
+    sample.decode("cp932")
+
+
+def test_detect_encoding_shift_jis_cut_mid_character():
+    data = _shift_jis_csv_cut_mid_character()
+    assert detect_encoding(io.BytesIO(data)) in ("shift_jis", "cp932")
+
+
+@pytest.mark.parametrize("reader", READERS)
+def test_non_numeric_score_is_rejected(reader, monkeypatch):
+    csv_text = "国語,第1回,abc,小3,山田,太郎\n数学,第1回,80,小3,鈴木,花子\n"
+    with pytest.raises(ValueError, match="点数に数値でない値"):
+        _read_with(reader, csv_text, monkeypatch)
+
+
+@pytest.mark.parametrize("reader", READERS)
+def test_score_dtype_is_numpy_integer(reader, monkeypatch):
+    csv_text = "国語,第1回,95,小3,山田,太郎\n数学,第1回,80,小3,鈴木,花子\n"
+    df = _read_with(reader, csv_text, monkeypatch)
+    assert df["score"].dtype.kind == "i"
+    assert not isinstance(df["score"].dtype, pd.ArrowDtype)
+    assert df["score"].tolist() == [95, 80]
+
+
+@pytest.mark.parametrize("reader", READERS)
+def test_fractional_score_is_rejected(reader, monkeypatch):
+    csv_text = "国語,第1回,95.5,小3,山田,太郎\n数学,第1回,88,小3,鈴木,花子\n"
+    with pytest.raises(ValueError, match="点数は整数である必要があります"):
+        _read_with(reader, csv_text, monkeypatch)